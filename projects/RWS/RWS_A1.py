@@ -27,7 +27,6 @@ Turn off recording to close serial port and end capture.
 """
 from sl3 import *
 import serial
-import re
 
 diagnostics_on = False  # set to True to have system add info to script status
 
@@ -35,11 +34,15 @@ diagnostics_on = False  # set to True to have system add info to script status
 port_sensor = serial.Serial()  # serial port object.  does not open it yet
 port_opened = False  # did we open the serial port?
 
-assembled_line = ""  # as we get data from the sensor, we store it here
+assembled_line = bytearray()  # as we get data from the sensor, we store it here
 assembled_drop_it = True  # we drop the first line from the sensor as it may be incomplete
+line_end_bytes = (13, 10)  # '\r' and '\n' as ints, the way readchar() returns them
 
 sensor_data = ""  # we store some of the last sensor data in here for diagnostics
 
+# capture_aml sets this when testing so that parse_line prints each line without calling is_being_tested()
+line_diagnostics = False
+
 # if there is an error, we set readings to this
 error9991 = 9991  # too few or too few good values received
 error9999 = 9999  # recorder error
@@ -50,11 +53,9 @@ sum_tm = 0.0
 sum_uv = 0.0
 sum_count = 0
 
-# processed sensor data result
-proc_ec = error9999
-proc_tm = error9999
-proc_uv = error9999
-proc_valid = False
+# processed sensor data result: ec, temp, uv, valid
+# the tuple is replaced as a whole, so readers always see results from the same computation
+proc_result = (error9999, error9999, error9999, False)
 proc_samples = 0
 
 """
@@ -145,6 +146,22 @@ def sensor_port_close():
         port_opened = False
 
 
+def line_to_str(one_line):
+    """
+    converts a line of sensor data to a str without raising on line noise;
+    if the line is not valid UTF-8, each byte is converted on its own
+
+    :param one_line: one line of sensor data capture on the serial port
+    :type one_line: bytes
+    :return: the line as a str
+    :rtype: str
+    """
+    try:
+        return one_line.decode()
+    except UnicodeError:
+        return "".join([chr(b) for b in one_line])
+
+
 def update_results(ec, temp, uv, valid, one_line):
     """
     call once we have a set of samples from the sensor
@@ -155,11 +172,15 @@ def update_results(ec, temp, uv, valid, one_line):
     :param valid: True if values are valid
     :type valid: bool
     :param one_line: one line of sensor data capture on the serial port
-    :type one_line: str
+    :type one_line: bytes
     :return: None
     """
     global sum_ec, sum_tm, sum_uv, sum_count, sensor_data
 
+    # convert the line before taking the lock
+    if diagnostics_on and len(one_line):
+        line_str = line_to_str(one_line)
+
     lock()  # thread safe access
 
     # keep a sum of the values we have so far
@@ -174,7 +195,7 @@ def update_results(ec, temp, uv, valid, one_line):
         if len(one_line):
             if len(sensor_data) > 1024*4:  # limit memory usage
                 sensor_data = ""
-            sensor_data += one_line
+            sensor_data += line_str
             sensor_data += "\n"
 
     unlock()
@@ -186,23 +207,17 @@ def process_results():
     and updates global variables with results
     """
     global sum_ec, sum_tm, sum_uv, sum_count
-    global proc_ec, proc_tm, proc_uv, proc_valid, proc_samples
+    global proc_result, proc_samples
 
     lock()  # thread safe access
 
     if sum_count > 0:
         # if we have enough good samples, compute average
-        proc_ec = sum_ec/sum_count
-        proc_tm = sum_tm/sum_count
-        proc_uv = sum_uv/sum_count
-        proc_valid = True
+        proc_result = (sum_ec/sum_count, sum_tm/sum_count, sum_uv/sum_count, True)
         proc_samples = sum_count
     else:
         # we have no values to process
-        proc_ec = error9991
-        proc_tm = error9991
-        proc_uv = error9991
-        proc_valid = False
+        proc_result = (error9991, error9991, error9991, False)
         proc_samples = 0
 
     # reset sums
@@ -216,20 +231,12 @@ def process_results():
 
 def read_results():
     """ accesses processed sensor data in a thread-safe manner
-    by grabbing all results under a single lock, we ensure all results are from the same computation
+    process_results replaces all results with a single assignment, so no lock is needed
+    to ensure all results are from the same computation
     :return: ec, temp, uv, valid
     :rtype: float, float, float, bool
     """
-    global proc_ec, proc_tm, proc_uv, proc_valid
-
-    lock()  # thread safe access
-    r_ec = proc_ec
-    r_temp = proc_tm
-    r_uv = proc_uv
-    r_valid = proc_valid
-    unlock()
-
-    return r_ec, r_temp, r_uv, r_valid
+    return proc_result
 
 
 @MEASUREMENT
@@ -273,27 +280,15 @@ def parse_line(one_line):
     Parases data and computes ec, temp, uv"""
 
     # We want to verify the data is valid
-    valid = True
-
-    if one_line[0] != ' ':
-        valid = False
-    else:
-        # split the string into tokens separated by 2 spaces (skip leading space)
-        tokens = one_line[1:].split('  ')
-
-        # this regular expression will match a number at the start of the string
-        number_parse = re.compile(r"\d+\.*\d*")
-
-        if len(tokens) != 3:
+    # the sensor right aligns its values, so a line without a leading space has been cut short
+    # the values are split from the decoded line, as float() on MicroPython does not accept bytes
+    tokens = line_to_str(one_line).split()
+    valid = one_line[0] == 32 and len(tokens) == 3  # 32 is a space
+    if valid:
+        try:
+            ec, temp, uv = map(float, tokens)
+        except ValueError:
             valid = False
-        else:
-            # parse the results
-            try:
-                ec = float(number_parse.match(tokens[0]).group(0))
-                temp = float(number_parse.match(tokens[1]).group(0))
-                uv = float(number_parse.match(tokens[2]).group(0))
-            except TypeError:
-                valid = False
 
     if not valid:
         ec = error9991
@@ -303,9 +298,9 @@ def parse_line(one_line):
     update_results(ec, temp, uv, valid, one_line)
 
     # for test builds, print diagnostics
-    if is_being_tested():
+    if line_diagnostics:
         # this is the the last capture and parse from the sensor
-        print("ec: {:12.4f}, temp: {:12.4f}, uv: {:12.4f}, input: \"{}\"".format(ec, temp, uv, one_line))
+        print("ec: {:12.4f}, temp: {:12.4f}, uv: {:12.4f}, input: \"{}\"".format(ec, temp, uv, line_to_str(one_line)))
 
         process_results()  # process it (even though we are averaging just one sample)
         print(format_output())  # format up the output
@@ -325,26 +320,26 @@ def assemble_data(one_byte):
     global assembled_line, assembled_drop_it
     line_complete = False
 
-    if one_byte == ord('\r') or one_byte == ord('\n'):
+    if one_byte in line_end_bytes:
         if assembled_drop_it:
             # Throw out the first line as it is most likely incomplete
-            assembled_line = ""
+            assembled_line = bytearray()
             assembled_drop_it = False
         else:
             if len(assembled_line) == 1:
                 None  # igonre a single \r or \n (we don't know the exact line terminator)
             elif len(assembled_line) < 5:
                 # not enough data
-                update_results(error9991, error9991, error9991, False, "")
-                assembled_line = ""
+                update_results(error9991, error9991, error9991, False, b"")
+                assembled_line = bytearray()
             else:
                 # parse the line for data
-                parse_line(assembled_line)
-                assembled_line = ""
+                parse_line(bytes(assembled_line))
+                assembled_line = bytearray()
                 line_complete = True
     else:
         # add byte to the string
-        assembled_line += chr(one_byte)
+        assembled_line.append(one_byte)
 
     return line_complete
 
@@ -355,36 +350,42 @@ def capture_aml():
     Captures data from the aml sensor.
     Does not exit until the serial port is closed.
     """
-    global port_sensor, assembled_drop_it
+    global port_sensor, assembled_drop_it, line_diagnostics
 
     # initialize
-    update_results(error9999, error9999, error9999, False, "")
+    update_results(error9999, error9999, error9999, False, b"")
     assembled_drop_it = True
     being_tested = is_being_tested()  # optimization
+    line_diagnostics = being_tested
     sensor_port_open()  # open the port
 
     # initialize additional measurements table
     initialize_additionals_table()
 
+    # the loop below runs once per byte; use locals rather than looking up globals every pass
+    if being_tested:
+        readchar = simulator_readchar
+    else:
+        readchar = port_sensor.readchar
+    assemble = assemble_data
+    read_setup = setup_read
+
     keep_looping = True
     while keep_looping:
 
         # pick up data on the port
-        if being_tested:
-            one_byte = simulator_readchar()
-        else:
-            one_byte = port_sensor.readchar()
+        one_byte = readchar()
 
         if one_byte != -1:
             # we got a byte
-            assemble_data(one_byte)
+            assemble(one_byte)
         elif being_tested:
             # no data. if we are testing, end loop when we get all data
             keep_looping = False
 
         # if recording is stopped, end loop
         if not being_tested:
-            if setup_read("Recording").upper() == "OFF":
+            if read_setup("Recording").upper() == "OFF":
                 keep_looping = False
 
     sensor_port_close()
@@ -631,7 +632,29 @@ def process_and_output():
         unlock()
 
 
+def test_parse_line():
+    """ parses lines of bytes as they come from the serial port, validating good and bad lines """
+    global line_diagnostics
+
+    diagnostics_were = line_diagnostics
+    line_diagnostics = False
+
+    parse_line(bytearray(b" 22.492  20.561  0000.000"))
+    process_results()
+    assert (read_results() == (22.492, 20.561, 0.0, True))
+
+    # a line cut short, a value that is not a number, and line noise are all rejected
+    for one_line in (b"19.108  20.026  0000.000", b" 19.050  0000.000", b" 19.0x0  19.874  0001.000",
+                     b" 1\xff.0  2.0  3.0"):
+        parse_line(bytearray(one_line))
+        process_results()
+        assert (read_results() == (error9991, error9991, error9991, False))
+
+    line_diagnostics = diagnostics_were
+
+
 # show debug output when testing on PC
 if not sutron_link:
+    test_parse_line()
     capture_aml()
 
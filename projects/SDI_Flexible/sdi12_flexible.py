@@ -22,12 +22,19 @@ flex_sdi_command = "M"
 # which SDI-12 bus to use (options are "Port1", "Port2", or "RS485")
 flex_sdi_bus = "Port1"
 
+# the settings above gathered into one tuple, read once per call by sdi_collect_improved_flex_param
+flex_settings = (flex_sdi_address, flex_wait_sec, flex_sdi_command, flex_sdi_bus)
+
 
 import re
 import utime
 from sl3 import *
 
 
+# matches the reply to a measure command: address, seconds to wait, number of values
+measure_reply_match = re.compile(r'(\d)(\d\d\d)(\d)')
+
+
 class Sdi12Error(Exception):
     pass
 
@@ -91,8 +98,8 @@ def sdi_collect_flex(address, wait_time, command="M", sdi_bus="Port1"):
     sensor_reply = sdi_send_command_get_reply(cmd_to_sensor, sdi_bus)
 
     # parse out the returned values
-    parsed = re.match('(\d)(\d\d\d)(\d)', sensor_reply)
-    if parsed is None or int(parsed.group(1)) != address:
+    parsed = measure_reply_match.match(sensor_reply)
+    if parsed is None or parsed.group(1) != str(address):
         raise Sdi12Error('No reply or bad reply', sensor_reply)
 
     # instead of waiting the sensor-specified time amount,
@@ -133,6 +140,9 @@ def sdi_collect_flex(address, wait_time, command="M", sdi_bus="Port1"):
 # keep track of the result of the last SDI-12 command
 last_custom_result = None
 
+# if the last SDI-12 command failed, this holds the Sdi12Error it raised
+last_custom_error = None
+
 # keep track of the time we issued the last SDI-12 command
 last_custom_time = 0
 
@@ -154,6 +164,7 @@ def sdi_collect_improved_flex(address, desired_parameter, wait_time, command="M"
     """
 
     global last_custom_result
+    global last_custom_error
     global last_custom_time
     # if it's been more than 10 seconds since we've collected
     # then collect data now:
@@ -161,13 +172,16 @@ def sdi_collect_improved_flex(address, desired_parameter, wait_time, command="M"
         try:
             # perform the custom measurement command
             last_custom_result = sdi_collect_flex(address, wait_time, command, sdi_bus)
+            last_custom_error = None
         except Sdi12Error as e:
-            last_custom_result = e
+            last_custom_result = None
+            last_custom_error = e
+        # stamp the time after the collection, as it includes the wait between M! and D!
         last_custom_time = utime.time()
     # if the last request caused an exception, we will just re-raise that
     # exception:
-    if type(last_custom_result) is Sdi12Error:
-        raise last_custom_result
+    if last_custom_error is not None:
+        raise last_custom_error
     # otherwise return the last value for the requested parameter
     return last_custom_result[desired_parameter]
 
@@ -182,17 +196,14 @@ def sdi_collect_improved_flex_param(desired_parameter):
                              (i.e. first param is 0)
     :return: float sensor result
     """
-    global flex_wait_sec
-    global flex_sdi_command
-    global flex_sdi_address
-    global flex_sdi_bus
+    address, wait_sec, command, sdi_bus = flex_settings
 
     result = sdi_collect_improved_flex(
-        flex_sdi_address,  # SDI-12 sensor address
+        address,  # SDI-12 sensor address
         desired_parameter,  # parameter in question, zero based (first parameter is 0)
-        flex_wait_sec,  # how long to wait between M! and D! commands
-        flex_sdi_command,  # SDI-12 command to issue
-        flex_sdi_bus)
+        wait_sec,  # how long to wait between M! and D! commands
+        command,  # SDI-12 command to issue
+        sdi_bus)
 
     return float(result)
 
@@ -19,9 +19,15 @@
     GP3 LateIntervalMin - ditto but if bottle count is greater than GP5
     GP4 BottleCapacity - how many vials the sampler holds
     GP5 BottleSwitch - at what bottle count the system should switch intervals
+    GP6 BatchSize - how many stage readings to collect before deciding whether to trigger
+        (1, or anything less, evaluates every reading as soon as it is made)
 
     GP10 TestMode - set to 1 to run dry tests on the system
 
+    The script reads the General Purpose Variables once and remembers them.
+    After changing them, run script task S3 (reload_config) or clear the bottle count
+    for the script to pick up the new values.
+
     The system also supports sending SMS messages if the bottle count runs low,
     but it is disabled by default
     Please see /projects/Sampler_Turbidity_B2 for a description of the SMS feature
@@ -29,6 +35,7 @@
     Bottle count may be reset via script task S1.
     Bottle count will be reset to 0 on power up.
     Sampler may be triggered via script task S2
+    General Purpose Variables may be reloaded via script task S3
 """
 
 from sl3 import *
@@ -40,12 +47,64 @@ bottles_used = 0
 # Time sampler was triggered last.
 time_last_trigger = 0.0
 
+# True while the sampler trigger output is being pulsed
+pulse_active = False
+
+# Earliest time the sampler may be triggered again.
+# None means it needs to be worked out, see trigger_time_next
+time_next_trigger = None
+
 # stage at last trigger
 value_last_trigger = 0.0
 
 # the most recent stage reading
 value_last_meas = 0.0
 
+# the part of the status message that only changes when the sampler is triggered or cleared
+# None means it needs to be rebuilt
+status_trigger_info = None
+
+# printing the script status takes time, so outside of a trigger or a test
+# it is only printed every status_print_every measurements
+status_print_every = 10
+status_print_count = 0  # measurements since the status was last printed
+
+# General Purpose Variables read from setup, e.g. gp_cache["GP1 value"] = 3.5
+gp_cache = {}
+
+
+def gp_read(name):
+    """
+    Returns the value of a General Purpose Variable.
+    Setup is only read the first time the variable is needed.
+
+    :param name: setup parameter to read, e.g. "GP1 value"
+    :type name: str
+    :return: value of the variable
+    :rtype: float
+    """
+    value = gp_cache.get(name)
+    if value is None:
+        value = float(setup_read(name))
+        gp_cache[name] = value
+    return value
+
+
+@TASK
+def reload_config():
+    """ tie this to a script task to pick up changes made to the General Purpose Variables"""
+    global time_next_trigger
+    gp_cache.clear()
+    time_next_trigger = None
+    status_changed()
+    select_stage_source()
+
+
+def status_changed():
+    """ call when the bottle count or trigger trackers change, so status_update rebuilds its message"""
+    global status_trigger_info
+    status_trigger_info = None
+
 
 def status_update():
     """
@@ -53,20 +112,29 @@ def status_update():
     :return: human readable status
     :rtype: str
     """
-    global bottles_used
-    global time_last_trigger
-    global value_last_trigger
-    global value_last_meas
+    global status_trigger_info
 
     # add diagnostic info to the script status
-    message = ("Bottles used: {}/{:.0f}\n".format(bottles_used, float(setup_read("GP4 value"))))
-    if bottles_used >= 1:
-        message += ("Last trigger: {}\n".format(ascii_time(time_last_trigger)))
-        message += ("Stage was: {}\n".format(value_last_trigger))
-    else:
-        message += "Not triggered since reset\n"
-    message += ("Current stage: {}\n".format(value_last_meas))
-    return message
+    # only the current stage changes on every measurement, the rest is rebuilt on demand
+    message = status_trigger_info
+    if message is None:
+        message = ("Bottles used: {}/{:.0f}\n".format(bottles_used, gp_read("GP4 value")))
+        if bottles_used >= 1:
+            message += ("Last trigger: {}\n".format(ascii_time(time_last_trigger)))
+            message += ("Stage was: {}\n".format(value_last_trigger))
+        else:
+            message += "Not triggered since reset\n"
+        status_trigger_info = message
+    return message + "Current stage: {}\n".format(value_last_meas)
+
+
+def status_print(triggered):
+    """ prints the script status if the sampler was triggered, the script is being tested, or it is due"""
+    global status_print_count
+    status_print_count += 1
+    if triggered or status_print_count >= status_print_every or is_being_tested():
+        print(status_update())
+        status_print_count = 0
 
 
 @MEASUREMENT
@@ -86,6 +154,10 @@ def clear_bottle_count():
     time_last_trigger = 0.0
     value_last_trigger = 0.0
 
+    # the sampler is being serviced; the settings may have changed too
+    # reloading them also refreshes the status
+    reload_config()
+
     # write a log entry
     reading = Reading(label="BottleClear", time=utime.time(), etype='E')
     reading.write_log()
@@ -93,8 +165,31 @@ def clear_bottle_count():
     print(status_update())
 
 
+def log_event(label, time_stamp, value, units=""):
+    """ writes an event to the log, e.g. the sampler being triggered"""
+    Reading(label=label,
+            time=time_stamp,
+            etype='E',
+            value=value,
+            right_digits=0,
+            units=units,
+            quality='G').write_log()
+
+
 def trigger_sampler_master(time_stamp):
-    """triggers sampler, updates trackers"""
+    """
+    triggers sampler, updates trackers
+
+    :return: True if sampler was triggered, False if it was already being triggered
+    """
+    # a script task and a measurement could both try to trigger the sampler at once
+    global pulse_active
+    lock()
+    busy = pulse_active
+    pulse_active = True
+    unlock()
+    if busy:
+        return False
 
     # increment the number of bottles used
     global bottles_used
@@ -102,21 +197,23 @@ def trigger_sampler_master(time_stamp):
 
     # update the time of the last trigger
     global time_last_trigger
+    global time_next_trigger
     time_last_trigger = time_stamp
+    time_next_trigger = None
+    status_changed()
+
+    # write a log entry first, so that it is not held up by the pulse
+    log_event("Triggered", time_stamp, bottles_used)
 
     # trigger sampler by pulsing output
-    output_control('OUTPUT1', True)
-    utime.sleep(5)
-    output_control('OUTPUT1', False)
+    try:
+        output_control('OUTPUT1', True)
+        utime.sleep(5)
+        output_control('OUTPUT1', False)
+    finally:
+        pulse_active = False
 
-    # write a log entry
-    reading = Reading(label="Triggered",
-                      time=time_stamp,
-                      etype='E',
-                      value=bottles_used,
-                      right_digits=0,
-                      quality='G')
-    reading.write_log()
+    return True
 
 
 @TASK
@@ -127,6 +224,26 @@ def trigger_sampler_now():
     print(status_update())
 
 
+def trigger_time_next():
+    """
+    Works out the earliest time the sampler may be triggered again.
+    The answer is kept until the sampler is triggered or the settings are reloaded.
+
+    :return: time in seconds since 1970
+    :rtype: float
+    """
+    global time_next_trigger
+
+    if time_next_trigger is None:
+        if bottles_used >= gp_read("GP5 value"):
+            deadtime_seconds = gp_read("GP3 value") * 60  # Late interval
+        else:
+            deadtime_seconds = gp_read("GP2 value") * 60  # Initial interval
+        time_next_trigger = time_last_trigger + deadtime_seconds
+
+    return time_next_trigger
+
+
 def trigger_sampler_attempt(time_stamp):
     """
     Call to attempt to trigger the sampler.
@@ -134,31 +251,18 @@ def trigger_sampler_attempt(time_stamp):
 
     :return: True if sampler was triggered.
     """
-    global bottles_used
-    global time_last_trigger
+    # checked first as it needs no settings
+    if is_being_tested():
+        return False  # script is being tested
 
-    bottles_capacity = float(setup_read("GP4 value"))
-    bottle_switch = float(setup_read("GP5 value"))
-    if bottles_used >= bottle_switch:
-        deadtime_seconds = float(setup_read("GP3 value")) * 60  # Late interval
-    else:
-        deadtime_seconds = float(setup_read("GP2 value")) * 60  # Initial interval
+    # too soon since last; trigger_time_next works out the dead time for the bottle count
+    if time_stamp < trigger_time_next():
+        return False
 
-    trigger = True
+    if bottles_used >= gp_read("GP4 value"):
+        return False  # out of bottles
 
-    if bottles_used >= bottles_capacity:
-        trigger = False  # out of bottles
-    elif time_stamp - time_last_trigger < deadtime_seconds:
-        trigger = False  # too soon since last
-    elif is_being_tested():
-        trigger = False  # script is being tested
-
-    if trigger:
-        trigger_sampler_master(time_stamp)  # Call routine that controls sampler.
-        return True
-
-    else:
-        return False  # Sampler was NOT triggered.
+    return trigger_sampler_master(time_stamp)  # Call routine that controls sampler.
 
 
 """
@@ -166,53 +270,110 @@ def trigger_sampler_attempt(time_stamp):
 # in this mode, instead of measuring a real sensor
 # the system sequentially pulls sensor data from the list below
 """
-test_value = [1.00, 1.21, 1.40, 2.02, 2.58, 2.86,
+test_value = (1.00, 1.21, 1.40, 2.02, 2.58, 2.86,
               3.42, 3.99, 4.56, 5.00, 5.44, 5.88,
               5.77, 5.45, 5.76, 5.78, 6.01, 6.12,
               6.32, 6.76, 7.20, 7.44, 6.00, 4.56,
-              3.12, 1.68, 1.55, 1.50, 1.32, 0.99]
+              3.12, 1.68, 1.55, 1.50, 1.32, 0.99)
 test_index = 0
 
 
+def test_stage(stage):
+    """ test mode - ignores the measured stage and returns the next value from test_value"""
+    global test_index
+    stage = test_value[test_index]
+    test_index = (test_index + 1) % len(test_value)
+    return stage
+
+
+def measured_stage(stage):
+    """ normal operation - returns the measured stage as is"""
+    return stage
+
+
+# stage_check gets its stage reading through this function
+stage_source = measured_stage
+
+
+def select_stage_source():
+    """ points stage_source at test_stage or measured_stage, depending on GP10 TestMode"""
+    global stage_source
+    if gp_read("GP10 value") >= 1.0:
+        stage_source = test_stage
+    else:
+        stage_source = measured_stage
+
+
+select_stage_source()
+
+def stage_batch_size():
+    """
+    stage_check may collect several stage readings before deciding whether to trigger
+    the sampler, so that settings are looked up and status is built once per batch.
+    Note that a larger batch delays triggering by up to that many measurements.
+
+    :return: the batch size from GP6 BatchSize, at least 1
+    :rtype: int
+    """
+    return max(1, int(gp_read("GP6 value")))
+
+
+# stage readings waiting to be evaluated, as (stage, time_stamp)
+stage_batch = []
+
+
+def stage_evaluate_batch():
+    """
+    Decides whether to trigger the sampler based on the readings in stage_batch
+    Empties stage_batch
+
+    :return: True if sampler was triggered.
+    """
+    global time_last_trigger
+    global time_next_trigger
+    global value_last_trigger
+
+    triggered = False
+    threshold = gp_read("GP1 value")
+    for stage, time_stamp in stage_batch:
+        # make sure time_last_trigger is not 0
+        # otherwise baseline triggers on first measurement after bootup
+        if time_last_trigger == 0.0:
+            time_last_trigger = time_stamp
+            time_next_trigger = None
+
+        if stage > threshold:
+            if trigger_sampler_attempt(time_stamp):
+                value_last_trigger = stage
+                status_changed()
+                triggered = True
+
+    stage_batch.clear()
+    return triggered
+
+
 @MEASUREMENT
 def stage_check(stage):
     """
     This function should be connected to the stage measurement
     When invoked, it will decide whether to trigger the sampler
+    (see stage_batch_size)
     """
-    global time_last_trigger
     global value_last_meas
 
-    # test mode - see test_value
-    if float(setup_read("GP10 value")) >= 1.0:
-        global test_value
-        global test_index
-        stage = test_value[test_index]
-        test_index += 1
-        if test_index >= len(test_value):
-            test_index = 0
+    # in test mode, this replaces the stage with one from test_value
+    stage = stage_source(stage)
 
     value_last_meas = stage
 
     # we use the time the measurement was SCHEDULED rather than real time
     # to ensure computations are not affected by system delays
-    time_stamp = time_scheduled()
+    stage_batch.append((stage, time_scheduled()))
 
-    # make sure time_last_trigger is not 0
-    # otherwise baseline triggers on first measurement after bootup
-    if time_last_trigger == 0.0:
-        time_last_trigger = time_stamp
+    # when testing, evaluate every reading so results show up right away
+    if len(stage_batch) >= stage_batch_size() or is_being_tested():
+        status_print(stage_evaluate_batch())
 
-    triggered = False
-    if stage > float(setup_read("GP1 value")):
-        if trigger_sampler_attempt(time_stamp):
-            triggered = True
-
-    if triggered:
-        global value_last_trigger
-        value_last_trigger = stage
-
-    print(status_update())
     return stage
 
 
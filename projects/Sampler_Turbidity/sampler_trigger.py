@@ -37,11 +37,24 @@ value_last_sample = 0.0
 # the sampler will tell us which slot was triggered
 last_sample_slot = -1
 
+# status lines describing the last trigger, rebuilt only after the sampler is triggered
+# None means they need to be rebuilt
+status_trigger_info = None
 
+
+import re
 import utime
 from sl3 import *
 
 
+# we will use this expression to parse the values from the sensor reply
+# every value starts with a sign and may have an exponent, e.g. +1.5 or -2.25e+02
+float_match = re.compile(r'[-+][0-9]*\.?[0-9]*([eE][-+]?[0-9]+)?')
+
+# names of the SDI-12 buses, in upper case
+sdi_buses = ("PORT1", "PORT2", "RS485")
+
+
 class Sdi12Error(Exception):
     pass
 
@@ -54,16 +67,13 @@ def sdi_bus_valid(sdi_bus):
     :return: True if provided parameter is a valid bus
     :rtype: Boolean
     """
-    bus_upper = sdi_bus.upper()
-    if ("PORT1" in bus_upper) or ("PORT2" in bus_upper) or ("RS485" in bus_upper):
-        return True
-    else:
-        return False
+    return sdi_bus.upper() in sdi_buses
 
 
 def sdi_send_command_get_reply(cmd_to_send, sdi_bus="Port1"):
     """
     Sends provided command out on the specified SDI-12 bus, gets reply from the sensor.
+    The caller is expected to have checked the bus with sdi_bus_valid
 
     :param cmd_to_send: the command to send on the SDI-12 bus, e.g. "0M!"
     :param sdi_bus: string indicating bus: "Port1", "Port2", or "RS485"
@@ -71,12 +81,9 @@ def sdi_send_command_get_reply(cmd_to_send, sdi_bus="Port1"):
     :rtype: str
     """
 
-    if sdi_bus_valid(sdi_bus):
-        reply = command_line('!SDI {} {}'.format(sdi_bus, cmd_to_send), 128)
-        if "Got reply: " in reply:
-            reply = reply.replace("Got reply:", "")
-    else:
-        raise Sdi12Error("No such bus", sdi_bus)
+    reply = command_line('!SDI ' + sdi_bus + ' ' + cmd_to_send, 128)
+    if "Got reply: " in reply:
+        reply = reply.replace("Got reply:", "")
 
     reply = reply.strip()
     return reply
@@ -93,47 +100,55 @@ def sdi_collect(address, command="M", sdi_bus="Port1"):
     :return: a list of floats containing all the returned parameters
     """
 
+    # check the bus once, rather than for every command we send
+    if not sdi_bus_valid(sdi_bus):
+        raise Sdi12Error("No such bus", sdi_bus)
+
+    # every command we send starts with the address
+    address = str(address)
+
     # create the SDI-12 cmd_to_sensor using the provided address
-    cmd_to_sensor = '{0}{1}!'.format(address, command)
+    cmd_to_sensor = address + command + '!'
 
     # issue the cmd_to_sensor and get the reply
     sensor_reply = sdi_send_command_get_reply(cmd_to_sensor, sdi_bus)
 
-    # parse out the returned values
-    parsed = re.match('(\d)(\d\d\d)(\d)', sensor_reply)
-    if parsed is None or int(parsed.group(1)) != address:
+    # the reply is five digits: address, seconds till data is ready, number of values
+    header = sensor_reply[:5]
+    if len(header) != 5 or not header.isdigit() or header[0] != address:
         raise Sdi12Error('No reply or bad reply', sensor_reply)
 
     # figure out how long and then wait for sensor to be ready
-    time_till_reply = int(parsed.group(2))
+    time_till_reply = int(header[1:4])
     utime.sleep(time_till_reply)
 
     # how many parameters did the sensor return?
-    values_returned = int(parsed.group(3))
+    values_returned = int(header[4])
 
     # all the parameters returned by the sensor end up here
     result = []
 
-    # we will use this expression to parse the values form the sensor reply
-    float_match = re.compile('([-+][0-9]*\.?[0-9]+[eE][-+]?[0-9]+)|([-+][0-9]*\.?[0-9]*)')
-
     # we need to issue one or more send data commands to the sensor
     data_index = 0
     while len(result) < values_returned and data_index <= 9:
         # create and issue the get data cmd_to_sensor
-        cmd_to_sensor = '{0}D{1}!'.format(address, data_index)
+        cmd_to_sensor = address + 'D' + str(data_index) + '!'
         sensor_reply = sdi_send_command_get_reply(cmd_to_sensor, sdi_bus)
 
         if (sensor_reply is None) or (sensor_reply == "No reply"):
-            raise Sdi12Error('Missing data at pos', len(parsed) + 1)
+            raise Sdi12Error('Missing data at pos', len(result) + 1)
 
         # parse out all the values returned by the sensor
         while len(result) < values_returned:
             parsed = float_match.search(sensor_reply)
             if parsed is None:
                 break
-            result.append(float(parsed.group(0)))
-            sensor_reply = sensor_reply.replace(parsed.group(0), '', 1)
+            value = parsed.group(0)
+            result.append(float(value))
+
+            # carry on after this value
+            # every value starts with a sign, so nothing before the match can equal it
+            sensor_reply = sensor_reply[sensor_reply.find(value) + len(value):]
 
         data_index += 1
     return result
@@ -163,6 +178,7 @@ def trigger_sampler_low():
     global samples_triggered
     global time_last_sample
     global last_sample_slot
+    global status_trigger_info
 
     # increment the number of samples
     samples_triggered += 1
@@ -172,6 +188,7 @@ def trigger_sampler_low():
 
     # trigger the sampler
     last_sample_slot = activate_sampler()
+    status_trigger_info = None
 
     # quality - if the sample failed, last_sample_slot is -1
     if last_sample_slot == -1:
@@ -196,27 +213,28 @@ def status_update(measurement=True, value=0.0):
     :type value: float
     :return: None
     """
-    global samples_triggered
-    global time_last_sample
-    global last_sample_slot
+    global status_trigger_info
 
-    print("Total samples triggered since boot: {}".format(samples_triggered))
-    if time_last_sample:
-        print("Last trigger: {}".format(ascii_time(time_last_sample)))
+    # these lines only change when the sampler is triggered
+    if status_trigger_info is None:
+        status_trigger_info = "Total samples triggered since boot: {}".format(samples_triggered)
+        if time_last_sample:
+            status_trigger_info += "\nLast trigger: {}".format(ascii_time(time_last_sample))
 
-        if last_sample_slot >= 0:
-            print("Last sample slot: {}".format(last_sample_slot))
+            if last_sample_slot >= 0:
+                status_trigger_info += "\nLast sample slot: {}".format(last_sample_slot)
+            else:
+                status_trigger_info += "\nLast trigger FAILED SDI-12 error: {}".format(last_sample_slot)
         else:
-            print("Last trigger FAILED SDI-12 error: {}".format(last_sample_slot))
+            status_trigger_info += "\nNot triggered since bootup"
 
+    print(status_trigger_info)
+    if time_last_sample:
         if measurement:
             print("Trigger value: {}".format(value))
         else:
             print("Last trigger was done manually")
 
-    else:
-        print("Not triggered since bootup")
-
 
 @TASK
 def trigger_sampler():
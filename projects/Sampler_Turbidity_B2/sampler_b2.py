@@ -3,6 +3,9 @@
     There is a setup file associated with this script sampler_b2_setup.txt
     The complete documentation is in sampler_b2_readme.pdf
 
+    The script reads the General Purpose Variables once and remembers them.
+    After changing them, run the reload_config script task (S3 ReloadCfg in the setup file)
+    or clear the bottle count (S1 ClearBottl) for the script to pick up the new values.
 """
 
 from sl3 import *
@@ -14,6 +17,13 @@ bottles_used = 0
 # Time sampler was triggered last.
 time_last_trigger = 0.0
 
+# True while the sampler trigger output is being pulsed
+pulse_active = False
+
+# Earliest time the sampler may be triggered again.
+# None means it needs to be worked out, see trigger_time_next
+time_next_trigger = None
+
 # Turbidity at last trigger
 value_last_trigger = 0.0
 
@@ -23,6 +33,41 @@ trigger_cause = ""
 # the most recent turbidity reading
 value_last_meas = 0.0
 
+# the part of the status message that only changes when the sampler is triggered or cleared
+# None means it needs to be rebuilt
+status_trigger_info = None
+
+# printing the script status takes time, so outside of a trigger or a test
+# it is only printed every status_print_every measurements
+status_print_every = 10
+status_print_count = 0  # measurements since the status was last printed
+
+# General Purpose Variables read from setup, e.g. gp_cache["GP1 value"] = 3.5
+gp_cache = {}
+
+
+def gp_read(name):
+    """
+    Returns the value of a General Purpose Variable.
+    Setup is only read the first time the variable is needed.
+
+    :param name: setup parameter to read, e.g. "GP1 value"
+    :type name: str
+    :return: value of the variable
+    :rtype: float
+    """
+    value = gp_cache.get(name)
+    if value is None:
+        value = float(setup_read(name))
+        gp_cache[name] = value
+    return value
+
+
+def status_changed():
+    """ call when the trigger trackers change, so status_update rebuilds its message"""
+    global status_trigger_info
+    status_trigger_info = None
+
 
 def status_update():
     """
@@ -30,24 +75,33 @@ def status_update():
     :return: human readable status
     :rtype: str
     """
-    global bottles_used
-    global time_last_trigger
-    global value_last_trigger
-    global trigger_cause
-    global value_last_meas
+    global status_trigger_info
+
+    # the trigger details are only rebuilt after they change
+    if status_trigger_info is None:
+        if trigger_cause != "":
+            status_trigger_info = ("Last trigger: {}\n".format(ascii_time(time_last_trigger)))
+            status_trigger_info += ("Because: {}\n".format(trigger_cause))
+            status_trigger_info += ("Turbidity was: {}\n".format(value_last_trigger))
+        else:
+            status_trigger_info = "Not triggered since reset\n"
 
     # add diagnostic info to the script status
-    message = ("Bottles used: {}/{:.0f}\n".format(bottles_used, float(setup_read("GP6 value"))))
-    if trigger_cause != "":
-        message += ("Last trigger: {}\n".format(ascii_time(time_last_trigger)))
-        message += ("Because: {}\n".format(trigger_cause))
-        message += ("Turbidity was: {}\n".format(value_last_trigger))
-    else:
-        message += "Not triggered since reset\n"
+    message = ("Bottles used: {}/{:.0f}\n".format(bottles_used, gp_read("GP6 value")))
+    message += status_trigger_info
     message += ("Current turbidity: {}\n".format(value_last_meas))
     return message
 
 
+def status_print(triggered):
+    """ prints the script status if the sampler was triggered, the script is being tested, or it is due"""
+    global status_print_count
+    status_print_count += 1
+    if triggered or status_print_count >= status_print_every or is_being_tested():
+        print(status_update())
+        status_print_count = 0
+
+
 @MEASUREMENT
 def bottles_used_meas(ignored):
     """ returns the number of bottles used"""
@@ -66,6 +120,10 @@ def clear_bottle_count():
     time_last_trigger = 0.0
     value_last_trigger = 0.0
     trigger_cause = ""
+    status_changed()
+
+    # the sampler is being serviced; the settings may have changed too
+    reload_config()
 
     # write a log entry
     reading = Reading(label="BottleClear", time=utime.time(), etype='E')
@@ -74,8 +132,31 @@ def clear_bottle_count():
     print(status_update())
 
 
+def log_event(label, time_stamp, value, units=""):
+    """ writes an event to the log, e.g. the sampler being triggered"""
+    Reading(label=label,
+            time=time_stamp,
+            etype='E',
+            value=value,
+            right_digits=0,
+            units=units,
+            quality='G').write_log()
+
+
 def trigger_sampler_master(time_stamp):
-    """triggers sampler, updates trackers"""
+    """
+    triggers sampler, updates trackers
+
+    :return: True if sampler was triggered, False if it was already being triggered
+    """
+    # a script task and a measurement could both try to trigger the sampler at once
+    global pulse_active
+    lock()
+    busy = pulse_active
+    pulse_active = True
+    unlock()
+    if busy:
+        return False
 
     # increment the number of bottles used
     global bottles_used
@@ -83,34 +164,51 @@ def trigger_sampler_master(time_stamp):
 
     # update the time of the last trigger
     global time_last_trigger
+    global time_next_trigger
     time_last_trigger = time_stamp
+    time_next_trigger = None
+
+    # write a log entry first, so that it is not held up by the pulse
+    log_event("Triggered", time_stamp, bottles_used)
 
     # trigger sampler by pulsing output
-    output_control('OUTPUT1', True)
-    utime.sleep(5)
-    output_control('OUTPUT1', False)
+    try:
+        output_control('OUTPUT1', True)
+        utime.sleep(5)
+        output_control('OUTPUT1', False)
+    finally:
+        pulse_active = False
 
-    # write a log entry
-    reading = Reading(label="Triggered",
-                      time=time_stamp,
-                      etype='E',
-                      value=bottles_used,
-                      right_digits=0,
-                      quality='G')
-    reading.write_log()
+    return True
 
 
 @TASK
 def trigger_sampler_now():
     """ tie this to a script task to manually trigger the sampler"""
-    trigger_sampler_master(utime.time())
-
-    global trigger_cause
-    trigger_cause = "User"
+    if trigger_sampler_master(utime.time()):
+        global trigger_cause
+        trigger_cause = "User"
+        status_changed()
 
     print(status_update())
 
 
+def trigger_time_next():
+    """
+    Works out the earliest time the sampler may be triggered again, based on GP3.
+    The answer is kept until the sampler is triggered or the settings are reloaded.
+
+    :return: time in seconds since 1970
+    :rtype: float
+    """
+    global time_next_trigger
+
+    if time_next_trigger is None:
+        time_next_trigger = time_last_trigger + gp_read("GP3 value") * 3600
+
+    return time_next_trigger
+
+
 def trigger_sampler_attempt(time_stamp):
     """
     Call to attempt to trigger the sampler.
@@ -118,108 +216,63 @@ def trigger_sampler_attempt(time_stamp):
 
     :return: True if sampler was triggered.
     """
-    bottles_capacity = float(setup_read("GP6 value"))
-    deadtime_seconds = float(setup_read("GP3 value")) * 3600
-    global bottles_used
-    global time_last_trigger
+    # checked first as it needs no settings
+    if is_being_tested():
+        return False  # script is being tested
 
-    trigger = True
+    # during the dead time after a trigger there is nothing else to check
+    if time_stamp < trigger_time_next():
+        return False
 
-    if bottles_used >= bottles_capacity:
-        trigger = False  # out of bottles
-    elif time_stamp - time_last_trigger < deadtime_seconds:
-        trigger = False  # too soon since last
-    elif is_being_tested():
-        trigger = False  # script is being tested
+    if bottles_used >= gp_read("GP6 value"):
+        return False  # out of bottles
 
-    if trigger:
-        trigger_sampler_master(time_stamp)  # Call routine that controls sampler.
-        return True
-
-    else:
-        return False  # Sampler was NOT triggered.
+    return trigger_sampler_master(time_stamp)  # Call routine that controls sampler.
 
 
-def baseline_check(time_stamp):
-    """
-    Is it time for a baseline sampler trigger?
-    """
-    baseline_interval_sec = float(setup_read("GP1 value")) * 3600
-    time_diff_sec = time_stamp - time_last_trigger
-    if time_diff_sec >= baseline_interval_sec:
-        if trigger_sampler_attempt(time_stamp):
-            # sampler triggered
-            global trigger_cause
-            trigger_cause = "Baseline"
-
-            # write event to log
-            Reading(label=trigger_cause,
-                    time=time_stamp,
-                    etype='E',
-                    value=time_diff_sec,
-                    right_digits=0,
-                    units="sec",
-                    quality='G').write_log()
-            return True
-
-    return False
-
-
-def change_since_last_trigger_check(current_turbidity, time_stamp):
-    """
-    Should we trigger based on current turbidity and last turbidity?
+def trigger_check(turbidity, time_stamp):
     """
-    global value_last_trigger
-    diff = current_turbidity - value_last_trigger
+    Should we trigger the sampler based on the turbidity and the time of the last trigger?
+    The reasons are tried in this order: change since last trigger, high threshold, baseline.
+    Settings are only read for the reasons that are actually tried.
 
-    limit = float(setup_read("GP2 value"))
-    if abs(diff) >= limit:
-        if trigger_sampler_attempt(time_stamp):
-            # sampler triggered
-            global trigger_cause
-            trigger_cause = "Change since last trigger"
+    :return: True if sampler was triggered.
+    """
+    global trigger_cause
 
-            # write event to log
-            Reading(label="ChangeSince",
-                    time=time_stamp,
-                    etype='E',
-                    value=diff,
-                    right_digits=0,
-                    quality='G').write_log()
-            return True
+    time_diff_sec = time_stamp - time_last_trigger
+    diff = turbidity - value_last_trigger
+
+    if abs(diff) >= gp_read("GP2 value"):
+        cause = "Change since last trigger"
+        label = "ChangeSince"
+        log_value = diff
+        units = ""
+    elif (turbidity >= gp_read("GP4 value")
+          and time_diff_sec >= gp_read("GP5 value") * 3600):
+        # turbidity is high enough and it has been long enough since last sample
+        cause = "Threshold"
+        label = cause
+        log_value = time_diff_sec
+        units = "sec"
+    elif time_diff_sec >= gp_read("GP1 value") * 3600:
+        cause = "Baseline"
+        label = cause
+        log_value = time_diff_sec
+        units = "sec"
+    else:
+        return False
 
-    return False
+    # whether the sampler may be triggered does not depend on the reason
+    if not trigger_sampler_attempt(time_stamp):
+        return False
 
+    # sampler triggered
+    trigger_cause = cause
 
-def high_threshold_check(current_turbididty, time_stamp):
-    """
-    Trigger based on high threshold?
-    """
-    threshold = float(setup_read("GP4 value"))
-    if current_turbididty >= threshold:
-        # turbidity is high enough
-        # but has it been long enough since last sample?
-        global time_last_trigger
-        time_diff_sec = time_stamp - time_last_trigger
-        time_interval = float(setup_read("GP5 value")) * 3600
-
-        if time_diff_sec >= time_interval:
-            if trigger_sampler_attempt(time_stamp):
-                # sampler triggered
-                global trigger_cause
-                trigger_cause = "Threshold"
-
-                # write event to log
-                Reading(label=trigger_cause,
-                        time=time_stamp,
-                        etype='E',
-                        value=time_diff_sec,
-                        right_digits=0,
-                        units="sec",
-                        quality='G').write_log()
-                return True
-
-    return False
+    # write event to log
+    log_event(label, time_stamp, log_value, units)
+    return True
 
 
 """
@@ -229,7 +282,7 @@ def high_threshold_check(current_turbididty, time_stamp):
 # a list of simulated turbidity values used for testing
 """
 """
-test_turbidity = [100, 150,7 201, 180,
+test_turbidity = (100, 150, 201, 180,
                   200, 210, 211, 209,
                   222, 223, 229, 230,
                   500, 750, 901, 902,
@@ -237,14 +290,51 @@ test_turbidity = [100, 150,7 201, 180,
                   2006, 2008, 2009, 2001,
                   1500, 1200, 800, 501,
                   450, 400, 350, 300,
-                  250, 203, 151, 103]
+                  250, 203, 151, 103)
 """
-test_turbidity = [0 , -1, 180, 181, 190, 191, 185, 192, 199,
+test_turbidity = (0 , -1, 180, 181, 190, 191, 185, 192, 199,
                   201, 222, 233, 580, 790, 2900, 2999, 3001,
                   3008, 3008, 3009, 3010, 3100, 2900, 2998,
-                  800, 700, 600, 500, 400, -1, 0, 180, 190]
+                  800, 700, 600, 500, 400, -1, 0, 180, 190)
 test_index = 0
 
+# catch a bad edit to test_turbidity when the script is loaded, rather than in turbidity_check
+assert len(test_turbidity) > 0 and all(isinstance(x, (int, float)) for x in test_turbidity), \
+    "bad test_turbidity"
+
+
+def test_turbidity_reading(turbidity):
+    """ test mode - ignores the measured turbidity and returns the next value from test_turbidity"""
+    global test_index
+    turbidity = test_turbidity[test_index]
+    test_index = (test_index + 1) % len(test_turbidity)
+    return turbidity
+
+
+def measured_turbidity(turbidity):
+    """ normal operation - returns the measured turbidity as is"""
+    return turbidity
+
+
+# turbidity_check gets its turbidity reading through this function
+turbidity_source = measured_turbidity
+
+
+@TASK
+def reload_config():
+    """ tie this to a script task to pick up changes made to the General Purpose Variables"""
+    global turbidity_source
+    global time_next_trigger
+    gp_cache.clear()
+    time_next_trigger = None
+    if gp_read("GP10 value") >= 1.0:
+        turbidity_source = test_turbidity_reading
+    else:
+        turbidity_source = measured_turbidity
+
+
+reload_config()
+
 
 @MEASUREMENT
 def turbidity_check(turbidity):
@@ -252,18 +342,12 @@ def turbidity_check(turbidity):
     This function should be connected to the turbidity measurement
     When invoked, it will decide whether to trigger the sampler
     """
-    global trigger_cause
     global time_last_trigger
+    global time_next_trigger
     global value_last_meas
 
-    # test mode - see test_turbidity
-    if float(setup_read("GP10 value")) >= 1.0:
-        global test_turbidity
-        global test_index
-        turbidity = test_turbidity[test_index]
-        test_index += 1
-        if test_index >= len(test_turbidity):
-            test_index = 0
+    # in test mode, this replaces the turbidity with one from test_turbidity
+    turbidity = turbidity_source(turbidity)
 
     value_last_meas = turbidity
 
@@ -275,20 +359,19 @@ def turbidity_check(turbidity):
     # otherwise baseline triggers on first measurement after bootup
     if time_last_trigger == 0:
         time_last_trigger = time_stamp
+        time_next_trigger = None
 
     triggered = False
-    if change_since_last_trigger_check(turbidity, time_stamp):
-        triggered = True
-    elif high_threshold_check(turbidity, time_stamp):
-        triggered = True
-    elif baseline_check(time_stamp):
-        triggered = True
+    # none of the checks can trigger the sampler during the dead time after a trigger
+    if time_stamp >= trigger_time_next():
+        triggered = trigger_check(turbidity, time_stamp)
 
     if triggered:
         global value_last_trigger
         value_last_trigger = turbidity
+        status_changed()
 
-    print(status_update())
+    status_print(triggered)
     return turbidity
 
 
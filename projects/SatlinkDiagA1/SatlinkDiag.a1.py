@@ -7,6 +7,7 @@ fwd: forward power during last transmission
 ref: reflected power during last transmission
 
 the provided script task log_diag should be scheduled to run a minute or so after TX1 completes
+once the location is known, the GPS is only read again once a day (see gps_refresh_sec)
 """
 
 from sl3 import *
@@ -18,6 +19,20 @@ def convert_to_decimal_degrees(degrees, minutes, seconds):
     return result
 
 
+def number_prefix(token):
+    """
+    Returns the number at the start of the provided string, e.g. "38" from "38o"
+
+    :param token: string starting with a number
+    :return: the digits and decimal points at the start of token, "" if there are none
+    :rtype: str
+    """
+    end = 0
+    while end < len(token) and (token[end].isdigit() or token[end] == '.'):
+        end += 1
+    return token[:end]
+
+
 def gps_parse_lat_long(gps_status):
     """
     Parses Satlink's STATUS GPS looking for the latitude and longitude.
@@ -42,35 +57,34 @@ def gps_parse_lat_long(gps_status):
         Lat N 38o 59' 50.01" Long W 77o 25' 24.46" Alt 134.6m(441.5ft)
     """
 
-    # split it into lines
-    lines = gps_status.split("\r\n")
-
-    # go through each line, looking for Lat and Long
-    found = False
-    for lat_long_line in lines:
-        if ("Lat" in lat_long_line) and ("Long" in lat_long_line):
-            found = True
-            break
-
-    if found:
-        # strip leading whitespace
-        clean_line = lat_long_line.lstrip()
+    # find the line with Lat and Long, without splitting the whole reply into lines
+    lat_long_line = ""
+    start = gps_status.find("Lat ")
+    if start >= 0:
+        end = gps_status.find("\r\n", start)
+        if end < 0:
+            end = len(gps_status)
+        lat_long_line = gps_status[start:end]
 
+    if "Long" in lat_long_line:
         # split the string into tokens separated by space
-        tokens = clean_line.split(' ')
+        # the line starts at Lat, so there is no leading whitespace to strip
+        # nothing after token 9 is needed, so the rest of the line is left in one piece
+        tokens = lat_long_line.split(' ', 9)
 
-        # this regular expression will match a number at the start of the string
-        number_parse = re.compile(r"\d+\.*\d*")
+        # we need tokens 2 to 4 for latitude and 7 to 9 for longitude
+        if len(tokens) < 10:
+            return 0.0, 0.0
 
         # parse and convert the numbers to ints and floats
         try:
-            lat_deg = int(number_parse.match(tokens[2]).group(0))
-            lat_min = int(number_parse.match(tokens[3]).group(0))
-            lat_sec = float(number_parse.match(tokens[4]).group(0))
+            lat_deg = int(number_prefix(tokens[2]))
+            lat_min = int(number_prefix(tokens[3]))
+            lat_sec = float(number_prefix(tokens[4]))
 
-            long_deg = int(number_parse.match(tokens[7]).group(0))
-            long_min = int(number_parse.match(tokens[8]).group(0))
-            long_sec = float(number_parse.match(tokens[9]).group(0))
+            long_deg = int(number_prefix(tokens[7]))
+            long_min = int(number_prefix(tokens[8]))
+            long_sec = float(number_prefix(tokens[9]))
 
             # compute latitude
             latitude = convert_to_decimal_degrees(lat_deg, lat_min, lat_sec)
@@ -90,8 +104,6 @@ def gps_parse_lat_long(gps_status):
 
         except ValueError:
             pass
-        except IndexError:
-            pass
 
     # if we got this far, our string did not contain the expected numbers
     return 0.0, 0.0
@@ -111,6 +123,44 @@ def gps_read_position():
     return gps_parse_lat_long(status)
 
 
+def line_after(text, marker, start=0):
+    """
+    Finds marker in text and returns the rest of that line.
+
+    :param text: text to search, e.g. the reply to STATUS TX
+    :param marker: text to look for, e.g. "Forward/reflected power:"
+    :param start: where in text to start looking
+    :return: the text between marker and the end of its line (None if marker is not found),
+        and where in text to carry on looking for the next marker
+    :rtype: str, int
+    """
+    found = text.find(marker, start)
+    if found < 0:
+        return None, start
+    found += len(marker)
+    end = text.find("\n", found)
+    if end < 0:
+        end = len(text)
+    return text[found:end], end
+
+
+def first_two_fields(line):
+    """
+    Returns the first two fields of a slash separated line, e.g. "12.34" and "11.84" from "12.34/11.84/11.81V"
+
+    :param line: slash separated values
+    :return: text before the first slash and text between the first and second slash, None if there is no slash
+    :rtype: tuple of str
+    """
+    first = line.find("/")
+    if first < 0:
+        return None
+    second = line.find("/", first + 1)
+    if second < 0:
+        second = len(line)
+    return line[:first], line[first + 1:second]
+
+
 def parse_tx_data(text):
     """
     Parse telemetry status to extract battery during tx, forward power, and reflected power.
@@ -130,17 +180,18 @@ def parse_tx_data(text):
 
     try:
         # Find and extract battery reading
-        if "Battery before/during/at end of tx:" in text:
-            battery_line = text.split("Battery before/during/at end of tx:")[1].split("\n")[0]
-            battery_values = battery_line.split("/")
-            if len(battery_values) > 1:
+        battery_line, pos = line_after(text, "Battery before/during/at end of tx:")
+        if battery_line is not None:
+            battery_values = first_two_fields(battery_line)
+            if battery_values is not None:
                 results["batt_tx"] = (float(battery_values[1]), True)
 
         # Find and extract forward and reflected power
-        if "Forward/reflected power:" in text:
-            power_line = text.split("Forward/reflected power:")[1].split("\n")[0]
-            power_values = power_line.split("/")
-            if len(power_values) > 1:
+        # the power line follows the battery line, so carry on from there
+        power_line, pos = line_after(text, "Forward/reflected power:", pos)
+        if power_line is not None:
+            power_values = first_two_fields(power_line)
+            if power_values is not None:
                 results["fwd"] = (float(power_values[0].strip()), True)
                 results["ref"] = (float(power_values[1].strip().rstrip("W")), True)
 
@@ -151,7 +202,10 @@ def parse_tx_data(text):
     return results
 
 
-# Example usage
+# Example STATUS TX replies and code for testing the tx status parser
+# They are quoted out so that they are not loaded onto the Satlink.
+# To test, remove the quotes around this block.
+'''
 text_tx1_good = """
 >STATUS TX
 TX1 GOES 300 Scheduled
@@ -226,69 +280,56 @@ TX8 Cell Scheduled
         Retx succeeded: 0 total, 0 today
         Tx failed: 0 total, 0 today"""
 
-
-# code for testing the tx status parser
-"""
 print(parse_tx_data(text_tx1_good))
 print(parse_tx_data(text_tx2_no_tx))
 print(parse_tx_data(text_sched_good_random_good))
 print(parse_tx_data(test_tx_status_a1))
-"""
+'''
 
 # have we read the location before?
 location_known = False
 latitude, longitude = 0.0, 0.0
 
+# once the location is known, the GPS is only read again after this many seconds
+gps_refresh_sec = 24 * 60 * 60
+
+# time the location was last read from the GPS
+time_last_fix = 0.0
+
 
 @TASK
 def log_diag():
 
-    global location_known, latitude, longitude
+    global location_known, latitude, longitude, time_last_fix
 
-    # get GPS location
-    m_latitude, m_longitude = gps_read_position()
-    if m_latitude != 0.0 and m_longitude != 0.0:
-        latitude = m_latitude
-        longitude = m_longitude
-        location_known = True
+    # every entry is logged with the same time
+    time_stamp = time_scheduled()
 
-    if location_known:  #either now or a prior reading
-        # write location to log
-        reading = Reading(label="lat", value=latitude, time=time_scheduled(), etype='E', units="deg")
-        reading.write_log()
-        reading = Reading(label="long", value=longitude, time=time_scheduled(), etype='E', units="deg")
-        reading.write_log()
+    # get GPS location, unless we already have a recent one
+    if not location_known or time_stamp - time_last_fix >= gps_refresh_sec:
+        m_latitude, m_longitude = gps_read_position()
+        if m_latitude != 0.0 and m_longitude != 0.0:
+            latitude = m_latitude
+            longitude = m_longitude
+            location_known = True
+            time_last_fix = time_stamp
 
     # get TX STATUS
     status = command_line("STATUS TX", 4 * 1024)
     parsed_data = parse_tx_data(status)
-    if parsed_data["batt_tx"][1]:  # Check if the battery reading is valid
-        battery_reading = Reading(
-            label="batt_tx",
-            value=parsed_data["batt_tx"][0],
-            time=time_scheduled(),
-            etype="E",
-            units="V"
-        )
-        battery_reading.write_log()
-
-    if parsed_data["fwd"][1]:  # Check if the forward power is valid
-        forward_power_reading = Reading(
-            label="fwd",
-            value=parsed_data["fwd"][0],
-            time=time_scheduled(),
-            etype="E",
-            units="W"
-        )
-        forward_power_reading.write_log()
-
-    if parsed_data["ref"][1]:  # Check if the reflected power is valid
-        reflected_power_reading = Reading(
-            label="ref",
-            value=parsed_data["ref"][0],
-            time=time_scheduled(),
-            etype="E",
-            units="W"
-        )
-        reflected_power_reading.write_log()
 
+    # gather the log entries first, then write them one after the other
+    readings = []
+
+    if location_known:  #either now or a prior reading
+        readings.append(Reading(label="lat", value=latitude, time=time_stamp, etype='E', units="deg"))
+        readings.append(Reading(label="long", value=longitude, time=time_stamp, etype='E', units="deg"))
+
+    # battery during tx, forward power, and reflected power are only logged if they were valid
+    for label, units in (("batt_tx", "V"), ("fwd", "W"), ("ref", "W")):
+        value, valid = parsed_data[label]
+        if valid:
+            readings.append(Reading(label=label, value=value, time=time_stamp, etype="E", units=units))
+
+    for reading in readings:
+        reading.write_log()
@@ -76,6 +76,13 @@ portPower = "SDI1"
 # update the image overlay the first time the script runs
 updateOverlay = True
 
+# Ymodem packets are gathered into blocks of this many bytes before they are written to the SDHC card
+writeBlockSize = 16 * 1024
+
+# the image folder and tx folder are only checked for (and created) when they change, not for every picture
+lastFolder = None
+txFolderMade = False
+
 totalPictures = 0
 totalFails = 0
 totalRetries = 0
@@ -90,6 +97,16 @@ NAK         = chr(0x15)  # CTRL-U
 CAN         = chr(0x18)  # CTRL-X
 CRC         = chr(0x43)  # "C"
 
+# single byte replies from the camera that end a Ymodem transfer
+byteEOT = str_to_bytes(EOT)
+byteCANCEL = str_to_bytes(CAN)
+
+# We are using the sed command to modify the overlay file, but there are some special characters we
+# need to "escape" with a back slash or else sed will misinterpret them. The back slash itself goes first
+# so the escapes added after it are not escaped again, and line endings are sent as literal \r and \n
+sedEscapes = (("\\", "\\\\"), ("$", "\\$"), (".", "\\."), ("*", "\\*"), ("[", "\\["), ("^", "\\^"),
+              ("\r", "\\\\r"), ("\n", "\\\\n"))
+
 class YmodemError(Exception):
     pass
 
@@ -129,13 +146,12 @@ def IsCameraOn():
         cmd = "POWER " + portPower
     return "On" in command_line(cmd)
 
-def FormattedTimeStamp(timeStamp, dateTimeString):
+def TimeStampFields(timeStamp):
     """
-    Add time and data information to a string
+    Build the time and date fields used by FormattedTimeStamp
 
-    :param timeStamp: a time to use to format the string s
-    :param dateTimeString: a string with key fields like {YYYY}{YY}{MM}{DD}{hh}{mm}{ss}
-    :return: dateTimeString with the key fields replaced with the actual date/time information from timeStamp
+    :param timeStamp: a time to break into fields
+    :return: a dictionary that translates keys like YYYY, MM, hh to the formatted values for timeStamp
     """
     t = list(localtime(timeStamp))
     # build up a dictionary we can use to translate from time / date keys to actual formatted values
@@ -143,9 +159,19 @@ def FormattedTimeStamp(timeStamp, dateTimeString):
     t[0] %= 100
     for i,j in zip(["YY","MM","DD","hh","mm","ss","dow","julian"], t):
         d[i] = "{:02}".format(j)
+    return d
+
+def FormattedTimeStamp(fields, dateTimeString):
+    """
+    Add time and data information to a string
+
+    :param fields: the time and date fields built by TimeStampFields
+    :param dateTimeString: a string with key fields like {YYYY}{YY}{MM}{DD}{hh}{mm}{ss}
+    :return: dateTimeString with the key fields replaced with the actual date/time information from fields
+    """
     # time stamp the string by converting text fields like {YY} in the string to the 2-digit year, etc
     # with the help of the dictionary we setup to help us
-    return dateTimeString.format(**d)
+    return dateTimeString.format(**fields)
 
 def GetOverlayText():
     """
@@ -169,29 +195,76 @@ def YmodemCheck(s, expect):
     return ok, seq, data, crc
 
 def PurgeInput(port):
+    """
+    Discards input until the camera has been quiet for 10ms
+
+    :param port: serial port
+    """
     t = port.timeout
-    port.timeout = 0.01
-    while port.read(256):
-        pass
-    port.timeout = t
+    try:
+        port.timeout = 0.01
+        while port.read(4096):
+            pass
+    finally:
+        port.timeout = t
 
-def YmodemRead(port, sendByte):
-    PurgeInput(port)
+def ReadExactly(port, n):
+    """
+    Reads n bytes from the port, carrying on after a short read until the port times out
+
+    :param port: serial port with pre-configured timeout
+    :param n: number of bytes to read
+    :return: the bytes read, fewer than n only if the port timed out
+    """
+    s = port.read(n)
+    while len(s) < n:
+        more = port.read(n - len(s))
+        if not more:
+            break
+        s += more
+    return s
+
+def YmodemSend(port, sendByte):
+    if sendByte in (NAK, CAN):
+        # after a short or corrupt packet the camera may still be sending the rest of it,
+        # so wait for it to go quiet or the tail would be read as the start of the retransmission
+        PurgeInput(port)
+    else:
+        # drop anything left over from the last packet; the camera does not send the next packet
+        # until it gets our ACK (or "C"), so there is no need to wait for it to go quiet
+        port.reset_input_buffer()
     port.write(sendByte)
+
+def YmodemReceive(port):
     s = port.read(1)
     if s:
         if s[0] == ord(SOH):
-            s += port.read(132)
+            s += ReadExactly(port, 132)
         elif s[0] == ord(STX):
-            s += port.read(1028)
+            s += ReadExactly(port, 1028)
     return s
 
+def YmodemRead(port, sendByte):
+    YmodemSend(port, sendByte)
+    return YmodemReceive(port)
+
+def WriteBlock(outputFile, data):
+    """
+    Write a block of the image to the SDHC card
+
+    :param outputFile: file the image is written to
+    :param data: the block to write
+    :return: True if all of the block was written
+    """
+    try:
+        return outputFile.write(data) == len(data)
+    except OSError:
+        return False
+
 def YmodemRecv(port, outputFile):
     global totalPictures, totalFails, totalRetries, lastLength
     currentLen = 0
     port.timeout = 3.0
-    byteCANCEL = str_to_bytes(CAN)
-    byteEOT = str_to_bytes(EOT)
     # an additional sleep to help purge out the Zmodem announce string
     sleep(0.1)
     retries = 0
@@ -214,19 +287,34 @@ def YmodemRecv(port, outputFile):
     ack = ACK+CRC
     n = 1
     retries = 0
-    cancels = 0
     ok = False
+    # rather than writing each small packet to the SDHC card, gather them into larger blocks
+    block = bytearray(writeBlockSize)
+    blockView = memoryview(block)
+    blockLen = 0
     while retries < 10:
-        # send an ACK or NAK and read the next Ymodem packet from the camera
-        s = YmodemRead(port, ack)
+        # send an ACK or NAK first, so the camera is already sending the next packet while a block
+        # that has no room for another 1K packet is written to the SDHC card
+        YmodemSend(port, ack)
+        if blockLen + 1024 > writeBlockSize:
+            if not WriteBlock(outputFile, blockView[:blockLen]):
+                # the camera already has our ACK, so cancel the transfer rather than leave a corrupt image
+                port.write(CAN + CAN)
+                ok = False
+                blockLen = 0
+                break
+            blockLen = 0
+        # read the next Ymodem packet from the camera
+        s = YmodemReceive(port)
         ack = ACK
         ok, seq, data, crc = YmodemCheck(s, n)
         # check and make sure the crc was correct
         if crc == crc_xmodem(data):
             if ok:
-                # packet is good, write it to disk
+                # packet is good, add it to the block
                 n += 1
-                outputFile.write(data)
+                blockView[blockLen:blockLen + len(data)] = data
+                blockLen += len(data)
                 currentLen += len(data)
                 retries = 0
             elif n == (seq+1)%256:
@@ -248,9 +336,15 @@ def YmodemRecv(port, outputFile):
             s = YmodemRead(port, ACK)
             break
         elif s == byteCANCEL:
-            cancel += 1
-            if cancel > 3:
+            # the camera aborts the transfer by sending two CAN bytes in a row, so read the second one
+            # right here: going round the loop would have YmodemSend flush it from the input and ACK
+            # a transfer the camera has already given up on
+            if port.read(1) == byteCANCEL:
                 break
+            # a lone CAN is most likely noise, so NAK and retry
+            ack = NAK
+            totalRetries += 1
+            retries += 1
         else:
             # the crc didn't check (probably a log message interfered) so NAK and retry
             ack = NAK
@@ -258,6 +352,10 @@ def YmodemRecv(port, outputFile):
             retries += 1
         n %= 256
 
+    # write whatever is left in the block; the transfer is only good if that works too
+    if blockLen and not WriteBlock(outputFile, blockView[:blockLen]):
+        ok = False
+
     # all done ... track statistics so we can report
     if ok:
         totalPictures += 1
@@ -279,9 +377,9 @@ def SendCommand(port, cmd):
 
 def SetCameraTime(port):
     t = localtime(time())
-    SendCommand(port, "date +%x -s \"{:02d}/{:02d}/{:02d}\"\r".format(t[1], t[2], t[0] % 100) )
-    SendCommand(port, "date +%X -s \"{:02d}:{:02d}:{:02d}\"\r".format(t[3], t[4], t[5]) )
-    SendCommand(port, "hwclock -w\r")
+    # set the date, the time, and the hardware clock in one shell line so we only wait for the prompt once
+    SendCommand(port, "date +%x -s \"{:02d}/{:02d}/{:02d}\"; date +%X -s \"{:02d}:{:02d}:{:02d}\"; hwclock -w\r".format(
+        t[1], t[2], t[0] % 100, t[3], t[4], t[5]))
 
 def UpdateOverlay(port, s):
     """
@@ -292,17 +390,18 @@ def UpdateOverlay(port, s):
     :return:            True if the overlay was updated
     """
     try:
-        # We are using the sed command to modify the overlay file, but there are some special characters we
-        # need to "escape" with a back slash or else sed will misinterpret them:
-        special = "\\$.*[^"
-        for ch in special:
-            s = s.replace(ch, "\\" + ch)
-        s = s.replace("\r", "\\\\r")
-        s = s.replace("\n", "\\\\n")
-        # use the linux stream editor to modify just the "overlay_text" line in the file and output to a temp file
-        SendCommand(port, "sed 's/overlay_text=.*/overlay_text=\"{}\"/' /etc/config/overlay0.conf >/var/tmp/overlay0.conf\r".format(s))
-        # copy the temp file back over the original
-        SendCommand(port, "cp /var/tmp/overlay0.conf /etc/config/overlay0.conf\r")
+        # escape the characters sed would misinterpret, skipping the ones the string does not contain
+        for ch, escaped in sedEscapes:
+            if ch in s:
+                s = s.replace(ch, escaped)
+        # use the linux stream editor to modify just the "overlay_text" line in the file and output to a temp file,
+        # then copy the temp file back over the original, but only if sed worked, and report if both worked;
+        # the "" in the echo keeps the camera's echo of the command line from matching the report
+        port.write("sed 's/overlay_text=.*/overlay_text=\"{}\"/' /etc/config/overlay0.conf >/var/tmp/overlay0.conf"
+                   " && cp /var/tmp/overlay0.conf /etc/config/overlay0.conf && echo overlay\"\"updated\r".format(s))
+        if not wait_for(port, "overlayupdated"):
+            return False
+        WaitPrompt(port)
         # make the changes made to overlay.conf permanent
         SendCommand(port, "config save\r")
     except YmodemError:
@@ -311,9 +410,12 @@ def UpdateOverlay(port, s):
 
 @TASK
 def TakePicture():
-    global totalPictures, totalFails, totalRetries, totalNoSD, lastLength, updateOverlay
+    global totalPictures, totalFails, totalRetries, totalNoSD, lastLength, updateOverlay, lastFolder, txFolderMade
 
     if not ismount("/sd"):
+        # a different card may be inserted, so the folders must be checked again
+        lastFolder = None
+        txFolderMade = False
         totalNoSD += 1
         raise SDCardNotMountedError("SD card must be inserted to take pictures")
 
@@ -326,13 +428,16 @@ def TakePicture():
     t2 = t1
     ok = False
     try:
-        t = time()
-        folder = FormattedTimeStamp(t, imageFolder)
-        fileName = FormattedTimeStamp(t, imageFileName)
+        # the folder and file name share one time stamp, so only break it into fields once
+        fields = TimeStampFields(time())
+        folder = FormattedTimeStamp(fields, imageFolder)
+        fileName = FormattedTimeStamp(fields, imageFileName)
         imagePath = folder + "/" + fileName
 
-        if not exists(folder):
-            command_line('FILE MKDIR "{}"'.format(folder))
+        if folder != lastFolder:
+            if not exists(folder):
+                command_line('FILE MKDIR "{}"'.format(folder))
+            lastFolder = folder
 
         with open(imagePath, "wb") as outputFile:
 
@@ -360,15 +465,12 @@ def TakePicture():
                 WaitPrompt(port)
                 # increase the baud rate to 115.2K kbaud
                 port.write("stty 115200\r")
+                # give the camera time to switch before we follow it
                 sleep(0.25)
 
-            # now communicate with the camera at 115.2K baud
-            with Serial("RS232", 115200) as port:
-                port.timeout = 3.0
-                port.rtscts = hwHandshake
-                if not hwHandshake:
-                    port.dtr = True
-                    port.rts = True
+                # now communicate with the camera at 115.2K baud, changing the rate in place rather
+                # than closing and re-opening the port, which would toggle the handshake lines
+                port.baudrate = 115200
                 PurgeInput(port)
                 if timeSync:
                     # set the camera's time so hopefully it will stamp the picture with the actual time
@@ -403,12 +505,17 @@ def TakePicture():
                 else:
                     raise YmodemError("Failed to capture picture")
         if ok and txFolder:
-            if not exists(txFolder):
-                command_line('FILE MKDIR "{}"'.format(txFolder))
+            if not txFolderMade:
+                if not exists(txFolder):
+                    command_line('FILE MKDIR "{}"'.format(txFolder))
+                txFolderMade = True
             command_line('FILE COPY "{}" "{}"'.format(imagePath, txFolder + "/" + fileName))
 
     except Exception as e:
         totalFails += 1
+        # check the folders again next time in case they are why we failed
+        lastFolder = None
+        txFolderMade = False
         raise e
     finally:
         if not leavePowerOn or not ok:
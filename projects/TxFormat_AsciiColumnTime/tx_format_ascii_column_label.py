@@ -27,22 +27,20 @@ def format_mod_column_label(column_format, label_list):
     """
 
     lines = column_format.strip().split("\r\n")
-    new_format = ""
+    new_lines = []  # joined once at the end rather than growing a string per reading
 
     # split into lines
     for i in range(len(lines)):
 
-        # split line into single readings
-        readings = lines[i].strip().split(" ")
-        for j in range(len(readings)):
-            convert_one = "{}: {}".format(label_list[j], readings[j])
-            if (j+1) == len(readings):  # last value
-                convert_one = convert_one + "\r\n"
-            else:
-                convert_one = convert_one + "; "
-            new_format = new_format + convert_one
-
-    return new_format
+        # split line into single readings and pair each with its label
+        readings = lines[i].split()
+        if len(readings) > len(label_list):
+            # never transmit a reading without its label, nor drop one
+            raise ValueError("more readings than labels", lines[i])
+        convert_line = ["%s: %s" % label_reading for label_reading in zip(label_list, readings)]
+        new_lines.append("; ".join(convert_line) + "\r\n")
+
+    return "".join(new_lines)
 
 
 @TXFORMAT
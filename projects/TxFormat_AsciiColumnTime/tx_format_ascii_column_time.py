@@ -40,7 +40,7 @@ def format_mod_column_time(column_format, time_tx, meas_interval):
     time_newest = (time_tx // meas_interval) * meas_interval
 
     lines = column_format.strip().split("\r\n")
-    new_format = ""
+    new_lines = []  # joined once at the end rather than growing a string per line
 
     # arrange lines of data from oldest first to newest first
     for i in range(len(lines)-1, -1, -1):
@@ -49,8 +49,8 @@ def format_mod_column_time(column_format, time_tx, meas_interval):
         line_space_to_comma = lines[i].replace(" ", ",")
 
         convert_one = "2 {} {}\r\n".format(ascii_time_hms(time_this), line_space_to_comma)
-        new_format += convert_one
-    return new_format
+        new_lines.append(convert_one)
+    return "".join(new_lines)
 
 
 @TXFORMAT
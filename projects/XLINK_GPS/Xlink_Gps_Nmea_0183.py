@@ -30,8 +30,17 @@ m_invalid = -999.9  # what value to provide when lat/long is unknown
 m_latitude = m_invalid
 m_longitude = m_invalid
 m_time_last = 0
-m_last_line = ""  # last sentance from gps
-m_last_capture = []  # last capture session
+m_last_line = ""  # last sentance from gps (bytes if it was not GPGGA, as those are not decoded)
+m_last_capture = []  # last capture session, holding sentances like m_last_line
+m_capture_max = 64  # how many of the latest sentances m_last_capture keeps
+
+
+def capture_append(sentance):
+    """ adds a sentance to m_last_capture, dropping the oldest once it holds m_capture_max"""
+    global m_last_capture
+    m_last_capture.append(sentance)
+    if len(m_last_capture) > m_capture_max:
+        m_last_capture.pop(0)
 
 
 def update_globals(valid, lat, long, sentance):
@@ -50,11 +59,18 @@ def update_globals(valid, lat, long, sentance):
 
     m_last_line = sentance
     if sentance:
-        m_last_capture.append(sentance)
+        capture_append(sentance)
 
     m_time_last = utime.time()
 
 
+def sentance_text(sentance):
+    """ returns a sentance kept in the globals as a str, decoding it if it was kept as bytes"""
+    if isinstance(sentance, bytes):
+        return sentance.decode()
+    return sentance
+
+
 def print_results():
     """ prints results from the global variables"""
     global m_valid, m_latitude, m_longitude, m_last_line, m_time_last, m_invalid, m_last_capture
@@ -62,41 +78,42 @@ def print_results():
     if m_valid:
         print("Lat {:.{}f}, Long {:.{}f}, captured at {}.  Last sentance:".format(m_latitude, 4, m_longitude, 4,
                                                                                   ascii_time(utime.localtime())))
-        print(m_last_line)
+        print(sentance_text(m_last_line))
     elif m_last_line:
         print("No lat/long info.  Last capture was at {}.  Last sentance:".format(ascii_time(m_time_last)))
-        print(m_last_line)
+        print(sentance_text(m_last_line))
     else:
         print("No valid data from GPS.  Last attempt was at {}".format(ascii_time(m_time_last)))
 
     print("Last capture:")
-    print(m_last_capture)
+    print([sentance_text(sentance) for sentance in m_last_capture])
     print()
 
 
+def nmea_crc_matches(content, crc_hex):
+    """ checks the data content of an NMEA sentance (after $ and up to *) against the CRC after the * """
+    # Calculate the XOR checksum of the sentence
+    # walk the encoded bytes so each step is a plain int XOR, without an ord() call per character
+    calculated_crc = 0
+    for b in content.encode():
+        calculated_crc ^= b
+
+    # parse the CRC from the string as hex
+    expected_crc = int(crc_hex, 16)
+
+    # Return True if the calculated CRC matches the expected CRC, False otherwise
+    return calculated_crc == expected_crc
+
+
 def nmea_check_crc(sentence):
     """ checks NMEA sentance for a valid CRC"""
-    # Remove any leading or trailing whitespace and the $ and * characters
-    sentence = sentence.strip("$").strip("\r\n")
-    # Split the sentence: data content is after $ and to *, CRCis after *
-    fields = sentence.split("*")
+    # Remove the line ending and the $, then split once: data content is after $ and to *, CRC is after *
+    content, star, crc_hex = sentence.rstrip("\r\n").lstrip("$").partition("*")
 
-    if len(fields) < 2:
+    if not star:
         return False
     else:
-        # Calculate the XOR checksum of the sentence
-        calculated_crc = 0
-        for c in fields[0]:
-            calculated_crc ^= ord(c)
-
-        # parse the CRC from the string as hex
-        expected_crc = int(fields[1], 16)
-
-        # Return True if the calculated CRC matches the expected CRC, False otherwise
-        if calculated_crc == expected_crc:
-            return True
-        else:
-            return False
+        return nmea_crc_matches(content, crc_hex)
 
 
 def parse_nmea_0183_for_position(sentance):
@@ -109,18 +126,19 @@ def parse_nmea_0183_for_position(sentance):
     :param sentance: string
     :return: Bool Valid, float latitude, float longitude
     """
-    if len(sentance):
-        if sentance[0] == '$':
-            if nmea_check_crc(sentance):
-                tokens = sentance.split(',')
-                if tokens[0] == "$GPGGA":
-                    lat = float(tokens[2])
-                    if tokens[3] == 'S':  # denote south as negative
-                        lat = -lat
-                    long = float(tokens[4])
-                    if tokens[5] == 'W':  # West is negative
-                        long = -long
-                    return True, lat, long
+    # only GPGGA carries the position, so other sentances are dropped before the CRC is computed
+    if sentance.startswith("$GPGGA,"):
+        # split once: content is after $ and to *, CRC is after *
+        content, star, crc_hex = sentance.rstrip("\r\n")[1:].partition("*")
+        if star and nmea_crc_matches(content, crc_hex):
+            tokens = content.split(',')
+            lat = float(tokens[2])
+            if tokens[3] == 'S':  # denote south as negative
+                lat = -lat
+            long = float(tokens[4])
+            if tokens[5] == 'W':  # West is negative
+                long = -long
+            return True, lat, long
 
     return False, 0.0, 0.0
 
@@ -159,10 +177,15 @@ def gps_serial_port():
     start_time = utime.time()
     while True:
         raw_data = port_gps.readline()
-        sentance = raw_data.decode()  # decode from binary to unicode str
-
-        if parse_data_update_globals(sentance):
-            break
+        if raw_data.startswith(b"$GPGGA,"):
+            # only GPGGA carries the position, so only it is decoded and parsed
+            sentance = raw_data.decode()  # decode from binary to unicode str
+            if parse_data_update_globals(sentance):
+                break
+        else:
+            # other sentances are still tracked and captured, but kept as bytes;
+            # print_results decodes them only if it shows them
+            update_globals(False, 0.0, 0.0, raw_data)
 
         if (utime.time() - start_time) > total_time_sec:
             update_globals(False, 0, 0, "Timed out")
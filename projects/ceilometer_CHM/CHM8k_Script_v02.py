@@ -2,13 +2,30 @@ from sl3 import *
 from serial import Serial
 import utime
 
-### initiate variables for hourly values and hourly means
-aero1_1hr = []
-aero2_1hr = []
+### initiate variables for hourly sums, counts and hourly means
+aero1_sum = 0.0
+aero1_n = 0
+aero2_sum = 0.0
+aero2_n = 0
 out_aero1_nn = []
 out_aero2_mn = []
 count = 0
 
+### pick fields out of a string without splitting all of it ###
+def get_fields(s, sep, wanted):
+    """ returns a dict of the fields of s at the indices in wanted (sorted ascending),
+    scanning s only as far as the last wanted field """
+    fields = {}
+    start = 0
+    for index in range(wanted[-1] + 1):
+        end = s.find(sep, start)
+        if index in wanted:
+            fields[index] = s[start:] if end < 0 else s[start:end]
+        if end < 0:
+            break
+        start = end + len(sep)
+    return fields
+
 ### routing to set CHM8k to polling mode ###
 @TASK 
 def chm8k_set_polling():
@@ -36,8 +53,10 @@ def chm8k_polling():
     global aero1
     global aero2
     global cloud1
-    global aero1_1hr
-    global aero2_1hr
+    global aero1_sum
+    global aero1_n
+    global aero2_sum
+    global aero2_n
     global out_aero1_mn
     global out_aero2_mn
     global count
@@ -58,26 +77,23 @@ def chm8k_polling():
         print(line)                     # return the received data string to the user
     
     ### reading data from serial string ###
-    aero1 = str(line).split(";")[40]    # split string at ";" and select "aerosol layer 1"
-    aero2 = str(line).split(";")[41]    # split string at ";" and select "aerosol layer 2"
-    cloud1 = str(line).split(";")[6]    # split string at ";" and select "cloud layer 1"
-    
-    timesum = str(line).split(";")[4]
-    HH = float(str(timesum).split(":")[0])
-    MM = float(str(timesum).split(":")[1])
-    SS = float(str(timesum).split(":")[2])
+    fields = get_fields(str(line), ";", (6, 40, 41))   # pick the fields separated by ";"
+    aero1 = fields[40]                  # select "aerosol layer 1"
+    aero2 = fields[41]                  # select "aerosol layer 2"
+    cloud1 = fields[6]                  # select "cloud layer 1"
 
     utime.sleep(0.05)
     count = count + 1
     
-    ### handling missing data and filling hourly data vector ###
+    ### handling missing data and adding to the hourly sums ###
     if aero1 == "NODET":
         aero1 = float("nan")
     elif aero1 == "-----":
         aero1 = -2
     else:
         aero1 = float(aero1)
-        aero1_1hr.append(aero1)
+        aero1_sum += aero1
+        aero1_n += 1
 
     if aero2 == "NODET":
         aero2 = float("nan")
@@ -85,7 +101,8 @@ def chm8k_polling():
         aero2 = -2
     else:
         aero2 = float(aero2)
-        aero2_1hr.append(aero2)
+        aero2_sum += aero2
+        aero2_n += 1
 
     if cloud1 == "NODET":
         cloud1 = float("nan")
@@ -95,28 +112,30 @@ def chm8k_polling():
         cloud1 = float(cloud1)
 
     
-    ### once per hour: calc the mean values from each hourly data vector ###
+    ### once per hour: calc the mean values from each hourly sum ###
     if count == 12:
         ### aerosol layer 1 ###
-        if len(aero1_1hr) == 0:
+        if aero1_n == 0:
             out_aero1_mn = float("nan")
         else:
-            out_aero1_mn = sum(aero1_1hr)/len(aero1_1hr)
-        aero1_1hr = []      # reset vector for hourly data
+            out_aero1_mn = aero1_sum/aero1_n
+        aero1_sum = 0.0     # reset sum and count for hourly data
+        aero1_n = 0
         
         ### aerosol layer 2 ###
-        if len(aero2_1hr) == 0:
+        if aero2_n == 0:
             out_aero2_mn = float("nan")
         else:
-            out_aero2_mn = sum(aero2_1hr)/len(aero2_1hr)
-        aero2_1hr = []    # reset vector for hourly data
+            out_aero2_mn = aero2_sum/aero2_n
+        aero2_sum = 0.0   # reset sum and count for hourly data
+        aero2_n = 0
 
         count = 0
     
     # print(aero1)
     # print(aero2)
     # print(cloud1)
-    # print(aero1_1hr)
+    # print(aero1_sum, aero1_n)
 
 
 ### measurement functions and return arguments ###
@@ -23,6 +23,17 @@ class Sdi12Error(Exception):
     pass
 
 
+# each H4161 output is described by the sdi12 address of the H4161,
+# the measurement it outputs, and the measurement value that maps to full scale (20mA)
+h4161_outputs = (
+    (2, 1, 16),   # 201 River ght to analog output (0-16 feet)
+    (3, 2, 30),   # 202 AVM canal flow to analog output (0-30 cfs)
+    (4, 3, 20),   # 201a AVM fish release flow to analog output (0-20 cfs)
+    (5, 4, 130),  # Air Temp to analog output (0-130 deg F)
+    (6, 5, 100),  # Stilling Well Water Temp to analog output (0-100 deg F)
+)
+
+
 def sdi_bus_valid(sdi_bus):
     """
     Routine checks whether the provided parameter is a SDI-12 bus
@@ -50,8 +61,9 @@ def sdi_send_command_get_reply(cmd_to_send, sdi_bus="Port1"):
 
     if sdi_bus_valid(sdi_bus):
         reply = command_line('!SDI {} {}'.format(sdi_bus, cmd_to_send), 128)
-        if "Got reply: " in reply:
-            reply = reply.replace("Got reply:", "")
+        start = reply.find("Got reply: ")
+        if start >= 0:
+            reply = reply[start + len("Got reply:"):]
     else:
         raise Sdi12Error("No such bus", sdi_bus)
 
@@ -64,20 +76,10 @@ def sdi_4_20():
     """
     Converts measurement results to SDI-12 commands for H4161
     """
-    #  201 River ght to analog output (0-16 feet)
-    f = measure(1).value / 16 * 16 + 4  # yes f/16*16 = f, but consistency
-
-    #  202 AVM canal flow to analog output (0-30 cfs)
-    g = measure(2).value / 30 * 16 + 4
-
-    #  201a AVM fish release flow to analog output (0-20 cfs)
-    h = measure(3).value / 20 * 16 + 4
-
-    #  Air Temp to analog output (0-130 deg F)
-    i = measure(4).value / 130 * 16 + 4
-
-    #  Stilling Well Water Temp to analog output (0-100 deg F)
-    j = measure(5).value / 100 * 16 + 4
+    # measure everything first, converting each result to 4-20mA
+    outputs = []
+    for address, meas_index, full_scale in h4161_outputs:
+        outputs.append((address, measure(meas_index).value / full_scale * 16 + 4))
 
     """
     use extended command to set analog output values 
@@ -91,22 +93,7 @@ def sdi_4_20():
     """
     right_digits = 1  # as per H4161 manual examples
 
-    cmd = '2XSM{0:.{1}f}!'.format(f, right_digits)
-    sdi_send_command_get_reply(cmd)
-    utime.sleep(0.1)
-
-    cmd = '3XSM{0:.{1}f}!'.format(g, right_digits)
-    sdi_send_command_get_reply(cmd)
-    utime.sleep(0.1)
-
-    cmd = '4XSM{0:.{1}f}!'.format(h, right_digits)
-    sdi_send_command_get_reply(cmd)
-    utime.sleep(0.1)
-
-    cmd = '5XSM{0:.{1}f}!'.format(i, right_digits)
-    sdi_send_command_get_reply(cmd)
-    utime.sleep(0.1)
-
-    cmd = '6XSM{0:.{1}f}!'.format(j, right_digits)
-    sdi_send_command_get_reply(cmd)
-    utime.sleep(0.1)
+    for address, milliamps in outputs:
+        cmd = '{0}XSM{1:.{2}f}!'.format(address, milliamps, right_digits)
+        sdi_send_command_get_reply(cmd)
+        utime.sleep(0.1)
@@ -50,29 +50,33 @@ def NRDRS_format(shef):
     except Exception as e:
         print(e)
 
-    # User specified sensor name and TX order
-    tx_sensor_order = ['RNIN', 'WSM', 'WDD', 'ATF', 'FTF', 'RHP', 'BVV', 'FMP', 'WDDP', 'WSMP', 'SRW']
-
-    # User specified tx digits
-    tx_sensor_digits = [2,0,0,0,0,0,1,1,0,0,0]
+    # User specified sensor name and TX order, each with its tx digits
+    tx_sensor_order = [('RNIN', 2), ('WSM', 0), ('WDD', 0), ('ATF', 0), ('FTF', 0), ('RHP', 0), ('BVV', 1), ('FMP', 1),
+                       ('WDDP', 0), ('WSMP', 0), ('SRW', 0)]
 
     tx_str = '' # Initializing new empty tx string
-    shef_list = shef.split(":")
 
-    # iterating through tx_sensor_order list and keeping track of element index with x to use with digits list.
-    for x, sensor in enumerate(tx_sensor_order):
+    # Build a lookup from sensor label to the rest of its output in one pass over shef.
+    # Only the first output for each label is kept, and the label must be followed by a space
+    # so that 'WDD' does not match 'WDDP'.
+    shef_lookup = {}
+    for s in shef.split(":"):
+        label_rest = s.split(' ', 1)
+        if len(label_rest) == 2 and label_rest[0] not in shef_lookup:
+            shef_lookup[label_rest[0]] = label_rest[1]
+
+    for sensor, digits in tx_sensor_order:
         try:
-            # We want the first element of output list which starts with sensor label in shef_list.
-            # The space appended to sensor label is to match full word rather than partial match such as 'WDD' and 'WDDP'.
-            sensor_str = [s for s in shef_list if s.startswith(sensor+' ')][0]
+            sensor_str = shef_lookup.get(sensor)
+            if sensor_str is None:
+                print("sensor {} not found. Ignoring and moving on.".format(sensor))
+                continue
 
             # Extract last value from individual sensor string and cast it as float
             sensor_str = float(sensor_str.split()[-1])
 
-            # Append the rounded value to tx_str and limit the precision to digits specified in tx_sensor_digits list.
-            tx_str += '{:.{digits}f}\r\n'.format(sl3_round(sensor_str),digits=tx_sensor_digits[x])
-        except IndexError as e:
-            print("sensor {} not found. Ignoring and moving on.".format(sensor))
+            # Append the rounded value to tx_str and limit the precision to digits specified in tx_sensor_order list.
+            tx_str += '{:.{digits}f}\r\n'.format(sl3_round(sensor_str),digits=digits)
         except Exception as e:
             print("Error: {}".format(e))
     print(" ".join(tx_str.split('\r\n')))
@@ -14,7 +14,6 @@ A Sat/XLink setup is associated with this module:
 `gps_tracker_setup.txt <gps_tracker_setup.txt>`_
 """
 
-import re
 from sl3 import *
 
 
@@ -24,6 +23,20 @@ def convert_to_decimal_degrees(degrees, minutes, seconds):
     return result
 
 
+def number_prefix(token):
+    """
+    Returns the number at the start of the provided string, e.g. "38" from "38o"
+
+    :param token: string starting with a number
+    :return: the digits and decimal points at the start of token, "" if there are none
+    :rtype: str
+    """
+    end = 0
+    while end < len(token) and (token[end].isdigit() or token[end] == '.'):
+        end += 1
+    return token[:end]
+
+
 def gps_parse_lat_long(gps_status):
     """
     Parses Satlink's STATUS GPS looking for the latitude and longitude.
@@ -48,35 +61,34 @@ def gps_parse_lat_long(gps_status):
         Lat N 38o 59' 50.01" Long W 77o 25' 24.46" Alt 134.6m(441.5ft)
     """
 
-    # split it into lines
-    lines = gps_status.split("\r\n")
-
-    # go through each line, looking for Lat and Long
-    found = False
-    for lat_long_line in lines:
-        if ("Lat" in lat_long_line) and ("Long" in lat_long_line):
-            found = True
-            break
-
-    if found:
-        # strip leading whitespace
-        clean_line = lat_long_line.lstrip()
+    # find the line with Lat and Long, without splitting the whole reply into lines
+    lat_long_line = ""
+    start = gps_status.find("Lat ")
+    if start >= 0:
+        end = gps_status.find("\r\n", start)
+        if end < 0:
+            end = len(gps_status)
+        lat_long_line = gps_status[start:end]
 
+    if "Long" in lat_long_line:
         # split the string into tokens separated by space
-        tokens = clean_line.split(' ')
+        # the line starts at Lat, so there is no leading whitespace to strip
+        # nothing after token 9 is needed, so the rest of the line is left in one piece
+        tokens = lat_long_line.split(' ', 9)
 
-        # this regular expression will match a number at the start of the string
-        number_parse = re.compile(r"\d+\.*\d*")
+        # we need tokens 2 to 4 for latitude and 7 to 9 for longitude
+        if len(tokens) < 10:
+            return 0.0, 0.0
 
         # parse and convert the numbers to ints and floats
         try:
-            lat_deg = int(number_parse.match(tokens[2]).group(0))
-            lat_min = int(number_parse.match(tokens[3]).group(0))
-            lat_sec = float(number_parse.match(tokens[4]).group(0))
+            lat_deg = int(number_prefix(tokens[2]))
+            lat_min = int(number_prefix(tokens[3]))
+            lat_sec = float(number_prefix(tokens[4]))
 
-            long_deg = int(number_parse.match(tokens[7]).group(0))
-            long_min = int(number_parse.match(tokens[8]).group(0))
-            long_sec = float(number_parse.match(tokens[9]).group(0))
+            long_deg = int(number_prefix(tokens[7]))
+            long_min = int(number_prefix(tokens[8]))
+            long_sec = float(number_prefix(tokens[9]))
 
             # compute latitude
             latitude = convert_to_decimal_degrees(lat_deg, lat_min, lat_sec)
@@ -96,8 +108,6 @@ def gps_parse_lat_long(gps_status):
 
         except ValueError:
             pass
-        except IndexError:
-            pass
 
     # if we got this far, our string did not contain the expected numbers
     return 0.0, 0.0